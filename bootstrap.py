@@ -0,0 +1,107 @@
+"""
+Application bootstrap.
+
+Importing the bot modules performs no network I/O; this module brings the
+services up explicitly, concurrently and with retry/backoff, and records how
+long each startup phase took.
+
+Usage:
+    python bootstrap.py
+"""
+import asyncio
+import importlib
+import logging
+import time
+from typing import Dict
+
+from config import *
+
+logger = logging.getLogger(__name__)
+
+
+class StartupTimer:
+    """Collects wall-clock durations of named startup phases"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = {}
+
+    async def measure(self, name: str, coro):
+        begin = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            self.phases[name] = time.perf_counter() - begin
+
+    def measure_sync(self, name: str, func, *args):
+        begin = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            self.phases[name] = time.perf_counter() - begin
+
+    def report(self) -> str:
+        total = time.perf_counter() - self.started
+        parts = [f"{name}={seconds * 1000:.0f}ms" for name, seconds in self.phases.items()]
+        return f"🚀 Startup finished in {total * 1000:.0f}ms ({', '.join(parts)})"
+
+
+async def connect_client(client, retries: int = 5, backoff: float = 1.0, max_backoff: float = 16.0):
+    """Open the Telegram connection, retrying transient network failures"""
+    delay = backoff
+    for attempt in range(1, retries + 1):
+        try:
+            return await client.connect()
+        except (ConnectionError, OSError, asyncio.TimeoutError) as e:
+            if attempt == retries:
+                raise
+            logger.warning(f"⚠️ Telegram connection failed (attempt {attempt}/{retries}): {e}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, max_backoff)
+
+
+async def login_client(client, retries: int = 3):
+    """Log in as the bot, sleeping out FloodWaits longer than Telethon's own threshold"""
+    from telethon.errors import FloodWaitError
+
+    for attempt in range(1, retries + 1):
+        try:
+            return await client.start(bot_token=BOT_TOKEN)
+        except FloodWaitError as e:
+            if attempt == retries:
+                raise
+            logger.warning(f"⚠️ Login FloodWait (attempt {attempt}/{retries}): sleeping {e.seconds}s")
+            await asyncio.sleep(e.seconds)
+
+
+async def bootstrap():
+    """Connect the store and Telegram client concurrently; returns the bot module"""
+    timer = StartupTimer()
+
+    # Deferred so `import bootstrap` stays cheap; main pulls in Telethon
+    # and registers every handler on the (not yet connected) client.
+    app = timer.measure_sync('import', importlib.import_module, 'main')
+
+    # Only the network connects overlap. Logging in starts update handling,
+    # so it waits until handlers can rely on the final store backend.
+    await asyncio.gather(
+        timer.measure('store', app.db.connect_async()),
+        timer.measure('client', connect_client(app.bot)),
+    )
+    await timer.measure('login', login_client(app.bot))
+
+    logger.info(timer.report())
+    return app
+
+
+async def run():
+    app = await bootstrap()
+    await app.bot.run_until_disconnected()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    asyncio.run(run())
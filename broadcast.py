@@ -9,15 +9,24 @@ from telethon.errors import (
     PeerIdInvalidError,
     FloodWaitError
 )
-from database import db
+from database import db, SEGMENTS
+from peers import input_peers
+from outbound import OutboundScheduler, RESULT, BROADCAST
 
 logger = logging.getLogger(__name__)
 
 class BroadcastManager:
-    def __init__(self, bot: TelegramClient):
+    def __init__(self, bot: TelegramClient, scheduler: OutboundScheduler = None):
         self.bot = bot
+        self.scheduler = scheduler
         self.active_broadcasts = {}
     
+    async def _send(self, chat_id: int, send, lane: int = BROADCAST):
+        """Route a send through the outbound scheduler, if one is configured"""
+        if self.scheduler:
+            return await self.scheduler.submit(chat_id, send, lane)
+        return await send()
+    
     async def send_broadcast(
         self, 
         admin_id: int,
@@ -42,6 +51,7 @@ class BroadcastManager:
             Dictionary with broadcast statistics
         """
         users = db.get_all_users()
+        targets = input_peers(users)
         
         stats = {
             'total': len(users),
@@ -72,27 +82,29 @@ class BroadcastManager:
                 # Send message
                 if message_file:
                     # Send media message
-                    await self.bot.send_file(
-                        user_id,
+                    await self._send(user_id, lambda: self.bot.send_file(
+                        targets[user_id],
                         message_file,
                         caption=message_text,
                         buttons=reply_markup,
                         silent=disable_notification
-                    )
+                    ))
                 else:
                     # Send text message
-                    sent_msg = await self.bot.send_message(
-                        user_id,
+                    sent_msg = await self._send(user_id, lambda: self.bot.send_message(
+                        targets[user_id],
                         message_text,
                         buttons=reply_markup,
                         link_preview=False,
                         silent=disable_notification
-                    )
+                    ))
                     
                     # Pin message if requested
                     if pin_message:
                         try:
-                            await self.bot.pin_message(user_id, sent_msg.id, notify=False)
+                            await self._send(user_id, lambda: self.bot.pin_message(
+                                targets[user_id], sent_msg.id, notify=False
+                            ))
                         except:
                             pass
                 
@@ -102,8 +114,9 @@ class BroadcastManager:
                 if index % 50 == 0:
                     await self._send_progress(admin_id, stats, index, len(users))
                 
-                # Anti-flood delay
-                await asyncio.sleep(0.1)
+                # Anti-flood delay (the scheduler paces sends itself)
+                if not self.scheduler:
+                    await asyncio.sleep(0.1)
                 
             except UserIsBlockedError:
                 stats['blocked'] += 1
@@ -120,22 +133,27 @@ class BroadcastManager:
                 logger.warning(f"⚠️ Invalid user ID: {user_id}")
                 
             except FloodWaitError as e:
+                if self.scheduler:
+                    # The scheduler already paused and retried this send
+                    stats['failed'] += 1
+                    logger.warning(f"⚠️ FloodWait persisted for user {user_id}, skipping")
+                    continue
                 wait_time = e.seconds
                 logger.warning(f"⚠️ FloodWait: Sleeping for {wait_time} seconds")
                 await asyncio.sleep(wait_time)
                 # Retry this user
                 try:
                     if message_file:
-                        await self.bot.send_file(
-                            user_id, message_file, 
+                        await self._send(user_id, lambda: self.bot.send_file(
+                            targets[user_id], message_file, 
                             caption=message_text, 
                             buttons=reply_markup
-                        )
+                        ))
                     else:
-                        await self.bot.send_message(
-                            user_id, message_text, 
+                        await self._send(user_id, lambda: self.bot.send_message(
+                            targets[user_id], message_text, 
                             buttons=reply_markup
-                        )
+                        ))
                     stats['success'] += 1
                 except:
                     stats['failed'] += 1
@@ -166,7 +184,7 @@ class BroadcastManager:
                 f"🚫 Blocked: {stats['blocked']}\n"
                 f"👻 Deleted: {stats['deleted']}"
             )
-            await self.bot.send_message(admin_id, message)
+            await self._send(admin_id, lambda: self.bot.send_message(admin_id, message), RESULT)
         except Exception as e:
             logger.error(f"Failed to send progress: {e}")
     
@@ -186,21 +204,24 @@ class BroadcastManager:
             'failed': 0
         }
         
+        targets = input_peers(user_ids)
+        
         for user_id in user_ids:
             try:
                 if message_file:
-                    await self.bot.send_file(
-                        user_id, message_file, 
+                    await self._send(user_id, lambda: self.bot.send_file(
+                        targets[user_id], message_file, 
                         caption=message_text, 
                         buttons=reply_markup
-                    )
+                    ))
                 else:
-                    await self.bot.send_message(
-                        user_id, message_text, 
+                    await self._send(user_id, lambda: self.bot.send_message(
+                        targets[user_id], message_text, 
                         buttons=reply_markup
-                    )
+                    ))
                 stats['success'] += 1
-                await asyncio.sleep(0.1)
+                if not self.scheduler:
+                    await asyncio.sleep(0.1)
             except:
                 stats['failed'] += 1
         
@@ -228,6 +249,28 @@ class BroadcastManager:
             reply_markup
         )
     
+    async def broadcast_to_segment(
+        self,
+        admin_id: int,
+        segment: str,
+        message_text: str,
+        message_file: str = None,
+        reply_markup = None
+    ) -> Dict:
+        """
+        Broadcast to a named user segment (see database.SEGMENTS)
+        """
+        segment_users = db.get_segment(segment)
+        
+        logger.info(f"📢 Broadcasting to {len(segment_users)} users in '{SEGMENTS[segment]}'")
+        
+        return await self.broadcast_to_specific_users(
+            segment_users,
+            message_text,
+            message_file,
+            reply_markup
+        )
+    
     def get_broadcast_status(self, broadcast_id: str) -> Dict:
         """Get status of ongoing broadcast"""
         return self.active_broadcasts.get(broadcast_id, {})
@@ -62,6 +62,24 @@ TERABOX_COOKIE = os.getenv('TERABOX_COOKIE', '')
 MAX_FILE_SIZE = int(os.getenv('MAX_FILE_SIZE', '2000'))  # MB
 DOWNLOAD_TIMEOUT = int(os.getenv('DOWNLOAD_TIMEOUT', '3600'))  # seconds
 
+# ============================================
+# VIDEO PREVIEW CONFIGURATION
+# ============================================
+THUMBNAIL_FOLDER = os.path.join(DOWNLOAD_FOLDER, 'thumbs')
+PROBE_TIMEOUT = int(os.getenv('PROBE_TIMEOUT', '5'))  # seconds
+MEDIA_CACHE_HOURS = int(os.getenv('MEDIA_CACHE_HOURS', '24'))  # Cached metadata lifetime
+
+# ============================================
+# OUTBOUND RATE LIMIT
+# ============================================
+OUTBOUND_RATE = float(os.getenv('OUTBOUND_RATE', '25'))  # Max messages per second across all chats
+
+# ============================================
+# USAGE ANALYTICS CONFIGURATION
+# ============================================
+ANALYTICS_HOURLY_RETENTION = int(os.getenv('ANALYTICS_HOURLY_RETENTION', '48'))  # hours
+ANALYTICS_DAILY_RETENTION = int(os.getenv('ANALYTICS_DAILY_RETENTION', '90'))  # days
+
 # ============================================
 # BOT MESSAGES CONFIGURATION
 # ============================================
@@ -132,6 +150,7 @@ ADMIN_PANEL = """
 /setduration <hours> - Set token duration
 /setvalidity <hours> - Set validity period
 /stats - Bot statistics
+/usage - Usage analytics (daily active users, hourly activity)
 /broadcast - Send message to all users
 /ban <user_id> - Ban user
 /unban <user_id> - Unban user
@@ -1,27 +1,96 @@
-import redis
+import asyncio
+import gzip
 import json
+import threading
 import time
-from typing import Optional, Dict, List
+from datetime import datetime, timedelta
+from typing import Optional, Dict, List, Set, Iterable, Iterator, Tuple
 from config import *
+from hyperloglog import HyperLogLog
+
+# Key prefixes carried by export/import (caches are left out)
+EXPORT_PREFIXES = ('user', 'token', 'verify', 'ban', 'setting', 'peer')
+
+# Sorted-set indexes of user IDs scored by timestamp
+INDEX_ACTIVE = "index:active"
+INDEX_JOINED = "index:joined"
+INDEX_VERIFIED = "index:verified"
+INDEXES = (INDEX_ACTIVE, INDEX_JOINED, INDEX_VERIFIED)
+
+# Events counted per hour/day by record_event()
+USAGE_EVENTS = ('start', 'token', 'verification', 'link')
+
+# Named user segments for targeted broadcasts
+SEGMENTS = {
+    'active_7d': "Active in the last 7 days",
+    'joined_week': "Joined this week",
+    'never_verified': "Never verified",
+}
 
 class Database:
     def __init__(self):
-        try:
-            self.db = redis.Redis(
-                host=REDIS_HOST,
-                port=REDIS_PORT,
-                password=REDIS_PASSWORD if REDIS_PASSWORD else None,
-                decode_responses=True
-            )
-            self.db.ping()
-            print("✅ Redis connected successfully!")
-        except Exception as e:
-            print(f"❌ Redis connection failed: {e}")
-            print("⚠️ Using in-memory storage (data will be lost on restart)")
-            self.db = None
-            self.memory_store = {}
-    
-    def _get_key(self, prefix: str, user_id: int) -> str:
+        # No I/O here: the Redis connection is opened by connect() during
+        # bootstrap, or lazily on first use.
+        self._redis = None
+        self._connected = False
+        self._connect_lock = threading.Lock()
+        self.memory_store = {}
+    
+    @property
+    def db(self):
+        """Redis client, or None when running on the in-memory fallback"""
+        if not self._connected:
+            # If bootstrap's connect() is in flight this waits for its result
+            # instead of racing it and pinning the memory fallback.
+            self.connect(retries=1)
+        return self._redis
+    
+    @db.setter
+    def db(self, client):
+        self._redis = client
+        self._connected = True
+    
+    def connect(self, retries: int = 5, backoff: float = 0.5, max_backoff: float = 8.0):
+        """
+        Connect to Redis, retrying with exponential backoff before falling back to memory
+        Only the first call connects; later calls return the outcome of that attempt
+        """
+        with self._connect_lock:
+            if self._connected:
+                return self._redis is not None
+            return self._connect(retries, backoff, max_backoff)
+    
+    def _connect(self, retries: int, backoff: float, max_backoff: float) -> bool:
+        import redis
+        
+        delay = backoff
+        for attempt in range(1, retries + 1):
+            try:
+                client = redis.Redis(
+                    host=REDIS_HOST,
+                    port=REDIS_PORT,
+                    password=REDIS_PASSWORD if REDIS_PASSWORD else None,
+                    decode_responses=True
+                )
+                client.ping()
+                self.db = client
+                print("✅ Redis connected successfully!")
+                return True
+            except Exception as e:
+                print(f"❌ Redis connection failed (attempt {attempt}/{retries}): {e}")
+                if attempt < retries:
+                    time.sleep(delay)
+                    delay = min(delay * 2, max_backoff)
+        
+        print("⚠️ Using in-memory storage (data will be lost on restart)")
+        self.db = None
+        return False
+    
+    async def connect_async(self, retries: int = 5, backoff: float = 0.5, max_backoff: float = 8.0):
+        """Run connect() in a worker thread so other startup phases proceed meanwhile"""
+        return await asyncio.to_thread(self.connect, retries, backoff, max_backoff)
+    
+    def _get_key(self, prefix: str, user_id) -> str:
         return f"{prefix}:{user_id}"
     
     # ============================================
@@ -98,6 +167,23 @@ class Database:
                 'data': verify_data,
                 'expiry': verify_data['expires_at']
             }
+        self._index_add(INDEX_VERIFIED, user_id, verify_data['verified_at'])
+        self._record_first_verification(user_id, verify_data['verified_at'])
+    
+    def _record_first_verification(self, user_id: int, verified_at: float):
+        """
+        Keep the first verification time on the user record, which does not
+        expire, so the verified index can be rebuilt after verify:* lapses
+        """
+        user_data = self.get_user(user_id)
+        if user_data is None or 'first_verified_at' in user_data:
+            return
+        user_data['first_verified_at'] = verified_at
+        key = self._get_key("user", user_id)
+        if self.db:
+            self.db.set(key, json.dumps(user_data))
+        else:
+            self.memory_store[key] = {'data': user_data, 'expiry': float('inf')}
     
     def is_verified(self, user_id: int) -> bool:
         """Check if user has completed verification"""
@@ -132,13 +218,35 @@ class Database:
     # ============================================
     
     def add_user(self, user_id: int, user_data: dict):
-        """Add new user to database"""
+        """Add new user to database, keeping the original join time of returning users"""
         key = self._get_key("user", user_id)
-        user_data['joined_at'] = time.time()
+        existing = self.get_user(user_id)
+        now = time.time()
+        user_data['joined_at'] = existing.get('joined_at', now) if existing else now
+        if existing and 'first_verified_at' in existing:
+            user_data['first_verified_at'] = existing['first_verified_at']
         if self.db:
-            self.db.set(key, json.dumps(user_data))
+            pipe = self.db.pipeline(transaction=False)
+            pipe.set(key, json.dumps(user_data))
+            self._index_user(user_id, user_data, pipe)
+            self._count_unique(user_id, now, pipe)
+            pipe.execute()
         else:
             self.memory_store[key] = {'data': user_data, 'expiry': float('inf')}
+            self._index_user(user_id, user_data)
+            self._count_unique(user_id, now)
+    
+    def touch_user(self, user_id: int):
+        """Record an interaction in the activity index and today's unique users"""
+        now = time.time()
+        if self.db:
+            pipe = self.db.pipeline(transaction=False)
+            self._index_add(INDEX_ACTIVE, user_id, now, pipe)
+            self._count_unique(user_id, now, pipe)
+            pipe.execute()
+        else:
+            self._index_add(INDEX_ACTIVE, user_id, now)
+            self._count_unique(user_id, now)
     
     def get_user(self, user_id: int) -> Optional[dict]:
         """Get user data"""
@@ -153,7 +261,7 @@ class Database:
     def get_all_users(self) -> List[int]:
         """Get all user IDs"""
         if self.db:
-            keys = self.db.keys("user:*")
+            keys = self.db.scan_iter(match="user:*", count=1000)
             return [int(key.split(':')[1]) for key in keys]
         else:
             return [int(key.split(':')[1]) for key in self.memory_store.keys() if key.startswith('user:')]
@@ -182,6 +290,189 @@ class Database:
         else:
             return key in self.memory_store
     
+    def get_banned_users(self) -> Set[int]:
+        """Get all banned user IDs"""
+        if self.db:
+            keys = self.db.scan_iter(match="ban:*", count=1000)
+            return {int(key.split(':')[1]) for key in keys}
+        else:
+            return {int(key.split(':')[1]) for key in self.memory_store.keys() if key.startswith('ban:')}
+    
+    # ============================================
+    # PEER CACHE
+    # ============================================
+    
+    def save_peer(self, user_id: int, access_hash: int):
+        """Store a user's access hash so any process can address them directly"""
+        key = self._get_key("peer", user_id)
+        if self.db:
+            self.db.set(key, access_hash)
+        else:
+            self.memory_store[key] = {'data': access_hash, 'expiry': float('inf')}
+    
+    def get_peer(self, user_id: int) -> Optional[int]:
+        """Get a user's cached access hash"""
+        key = self._get_key("peer", user_id)
+        if self.db:
+            data = self.db.get(key)
+            return int(data) if data else None
+        else:
+            stored = self.memory_store.get(key)
+            return stored['data'] if stored else None
+    
+    def get_peers(self, user_ids: List[int], batch_size: int = 1000) -> Dict[int, int]:
+        """Get cached access hashes for many users (MGET in batches)"""
+        peers = {}
+        if self.db:
+            for i in range(0, len(user_ids), batch_size):
+                batch = user_ids[i:i + batch_size]
+                values = self.db.mget([self._get_key("peer", uid) for uid in batch])
+                peers.update((uid, int(value)) for uid, value in zip(batch, values) if value)
+        else:
+            for uid in user_ids:
+                stored = self.memory_store.get(self._get_key("peer", uid))
+                if stored:
+                    peers[uid] = stored['data']
+        return peers
+    
+    # ============================================
+    # ACTIVITY INDEXES & SEGMENTS
+    # ============================================
+    
+    def _index_add(self, index: str, user_id: int, score: float, pipe=None):
+        """Set a user's score in an index (memory fallback keeps a dict)"""
+        if self.db:
+            (pipe if pipe is not None else self.db).zadd(index, {user_id: score})
+        else:
+            stored = self.memory_store.setdefault(index, {'data': {}, 'expiry': float('inf')})
+            stored['data'][user_id] = score
+    
+    def _index_merge(self, index: str, user_id: int, score: float, pipe=None):
+        """
+        Merge a score into an index without losing newer data: the join index
+        keeps the earliest time, the others the latest
+        """
+        keep_earliest = index == INDEX_JOINED
+        if self.db:
+            (pipe if pipe is not None else self.db).zadd(
+                index, {user_id: score}, lt=keep_earliest, gt=not keep_earliest
+            )
+        else:
+            stored = self.memory_store.setdefault(index, {'data': {}, 'expiry': float('inf')})
+            current = stored['data'].get(user_id)
+            if current is not None:
+                score = min(current, score) if keep_earliest else max(current, score)
+            stored['data'][user_id] = score
+    
+    def _index_user(self, user_id: int, user_data: dict, pipe=None):
+        self._index_merge(INDEX_JOINED, user_id, user_data['joined_at'], pipe)
+        self._index_merge(INDEX_ACTIVE, user_id, user_data.get('last_active', user_data['joined_at']), pipe)
+        if 'first_verified_at' in user_data:
+            self._index_merge(INDEX_VERIFIED, user_id, user_data['first_verified_at'], pipe)
+    
+    def _index_range(self, index: str, min_score: float = float('-inf'),
+                     max_score: float = float('inf')) -> List[int]:
+        """User IDs in an index with min_score <= score <= max_score"""
+        if self.db:
+            return [int(uid) for uid in self.db.zrangebyscore(index, min_score, max_score)]
+        stored = self.memory_store.get(index)
+        if not stored:
+            return []
+        return [uid for uid, score in stored['data'].items() if min_score <= score <= max_score]
+    
+    def get_active_users(self, since: float) -> List[int]:
+        """Users who interacted at or after `since`"""
+        return self._index_range(INDEX_ACTIVE, since)
+    
+    def get_joined_users(self, since: float) -> List[int]:
+        """Users who joined at or after `since`"""
+        return self._index_range(INDEX_JOINED, since)
+    
+    def get_never_verified_users(self) -> List[int]:
+        """
+        Users who have never completed verification
+        Verifications are known from live verify:* records and the user
+        record's first_verified_at. Verifications that lapsed before
+        first_verified_at was stored cannot be recovered, so after a reindex
+        those users count as never verified.
+        """
+        if self.db:
+            return [int(uid) for uid in self.db.zdiff([INDEX_JOINED, INDEX_VERIFIED])]
+        verified = set(self._index_range(INDEX_VERIFIED))
+        return [uid for uid in self._index_range(INDEX_JOINED) if uid not in verified]
+    
+    def get_segment(self, segment: str) -> List[int]:
+        """Resolve a named segment (see SEGMENTS) to user IDs, excluding banned users"""
+        now = time.time()
+        if segment == 'active_7d':
+            users = self.get_active_users(now - 7 * 86400)
+        elif segment == 'joined_week':
+            today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            week_start = today - timedelta(days=today.weekday())
+            users = self.get_joined_users(week_start.timestamp())
+        elif segment == 'never_verified':
+            users = self.get_never_verified_users()
+        else:
+            raise ValueError(f"Unknown segment: {segment}")
+        banned = self.get_banned_users()
+        return [uid for uid in users if uid not in banned]
+    
+    def _index_record(self, key: str, value: str, pipe=None):
+        """Merge one raw user/verify record, or exported index entry, into the indexes"""
+        prefix, _, user_id = key.partition(':')
+        if prefix == 'user':
+            self._index_user(int(user_id), json.loads(value), pipe)
+        elif prefix == 'verify':
+            self._index_merge(INDEX_VERIFIED, int(user_id), json.loads(value)['verified_at'], pipe)
+        elif prefix == 'index':
+            index, _, user_id = key.rpartition(':')
+            self._index_merge(index, int(user_id), float(value), pipe)
+    
+    def rebuild_indexes(self) -> int:
+        """
+        Backfill indexes from stored user and verification records
+        Existing scores are merged, so newer activity is never rolled back
+        """
+        count = 0
+        pipe = self.db.pipeline(transaction=False) if self.db else None
+        for key, value, _ in self.iter_records():
+            if key.startswith('index:'):
+                continue
+            self._index_record(key, value, pipe)
+            count += 1
+            if pipe is not None and count % 1000 == 0:
+                pipe.execute()
+        if pipe is not None:
+            pipe.execute()
+        return count
+    
+    # ============================================
+    # MEDIA METADATA CACHE
+    # ============================================
+    
+    def save_media_meta(self, file_key: str, meta: dict):
+        """Cache probed video metadata for a file"""
+        key = self._get_key("media", file_key)
+        if self.db:
+            self.db.setex(key, MEDIA_CACHE_HOURS * 3600, json.dumps(meta))
+        else:
+            self.memory_store[key] = {
+                'data': meta,
+                'expiry': time.time() + (MEDIA_CACHE_HOURS * 3600)
+            }
+    
+    def get_media_meta(self, file_key: str) -> Optional[dict]:
+        """Get cached video metadata for a file"""
+        key = self._get_key("media", file_key)
+        if self.db:
+            data = self.db.get(key)
+            return json.loads(data) if data else None
+        else:
+            stored = self.memory_store.get(key)
+            if stored and stored['expiry'] > time.time():
+                return stored['data']
+            return None
+    
     # ============================================
     # STATISTICS
     # ============================================
@@ -199,10 +490,107 @@ class Database:
         return {
             'total_users': total_users,
             'active_tokens': active_tokens,
+            'daily_active': self.get_unique_users(1),
             'token_duration': TOKEN_DURATION_HOURS,
             'validity_period': TOKEN_VALIDITY_DAYS * 24  # Convert to hours
         }
     
+    # ============================================
+    # USAGE ANALYTICS
+    # ============================================
+    
+    @staticmethod
+    def _day_bucket(ts: float) -> str:
+        return time.strftime('%Y%m%d', time.gmtime(ts))
+    
+    @staticmethod
+    def _hour_bucket(ts: float) -> str:
+        return time.strftime('%Y%m%d%H', time.gmtime(ts))
+    
+    def _count_unique(self, user_id: int, now: float, pipe=None):
+        """Add the user to today's unique-user HyperLogLog"""
+        hll_key = f"stats:users:{self._day_bucket(now)}"
+        daily_ttl = ANALYTICS_DAILY_RETENTION * 86400
+        if self.db:
+            target = pipe if pipe is not None else self.db
+            target.pfadd(hll_key, user_id)
+            target.expire(hll_key, daily_ttl)
+        else:
+            stored = self.memory_store.get(hll_key)
+            if not stored or stored['expiry'] <= now:
+                stored = self.memory_store[hll_key] = {'data': HyperLogLog(), 'expiry': now + daily_ttl}
+            stored['data'].add(user_id)
+    
+    def record_event(self, event: str, user_id: int):
+        """
+        Count a handler outcome in the hourly and daily counters for the event.
+        Buckets expire after their retention period. Unique users are counted
+        separately, on every interaction, by touch_user()/add_user().
+        """
+        now = time.time()
+        day = self._day_bucket(now)
+        hour_key = f"stats:{event}:{self._hour_bucket(now)}"
+        day_key = f"stats:{event}:{day}"
+        hourly_ttl = ANALYTICS_HOURLY_RETENTION * 3600
+        daily_ttl = ANALYTICS_DAILY_RETENTION * 86400
+        
+        if self.db:
+            pipe = self.db.pipeline(transaction=False)
+            pipe.incr(hour_key)
+            pipe.expire(hour_key, hourly_ttl)
+            pipe.incr(day_key)
+            pipe.expire(day_key, daily_ttl)
+            pipe.execute()
+        else:
+            for key, ttl in ((hour_key, hourly_ttl), (day_key, daily_ttl)):
+                stored = self.memory_store.get(key)
+                if not stored or stored['expiry'] <= now:
+                    stored = self.memory_store[key] = {'data': 0, 'expiry': now + ttl}
+                stored['data'] += 1
+    
+    def get_unique_users(self, days: int = 1) -> int:
+        """Approximate distinct users over the last `days` days (1 = today)"""
+        now = time.time()
+        keys = [f"stats:users:{self._day_bucket(now - i * 86400)}" for i in range(days)]
+        if self.db:
+            return self.db.pfcount(*keys)
+        counters = [self.memory_store[key]['data'] for key in keys
+                    if key in self.memory_store and self.memory_store[key]['expiry'] > now]
+        return HyperLogLog.union(counters).count() if counters else 0
+    
+    def _get_counters(self, keys: List[str]) -> List[int]:
+        if self.db:
+            return [int(value or 0) for value in self.db.mget(keys)]
+        now = time.time()
+        counts = []
+        for key in keys:
+            stored = self.memory_store.get(key)
+            counts.append(stored['data'] if stored and stored['expiry'] > now else 0)
+        return counts
+    
+    def get_hourly_counts(self, event: str, hours: int = 24) -> List[tuple]:
+        """(hour bucket, count) for the last `hours` hours, oldest first"""
+        now = time.time()
+        buckets = [self._hour_bucket(now - i * 3600) for i in reversed(range(hours))]
+        counts = self._get_counters([f"stats:{event}:{bucket}" for bucket in buckets])
+        return list(zip(buckets, counts))
+    
+    def get_daily_counts(self, event: str, days: int = 7) -> List[tuple]:
+        """(day bucket, count) for the last `days` days, oldest first"""
+        now = time.time()
+        buckets = [self._day_bucket(now - i * 86400) for i in reversed(range(days))]
+        counts = self._get_counters([f"stats:{event}:{bucket}" for bucket in buckets])
+        return list(zip(buckets, counts))
+    
+    def get_usage_stats(self) -> dict:
+        """Today's usage summary; cost is independent of the number of users"""
+        today = {event: self.get_daily_counts(event, 1)[0][1] for event in USAGE_EVENTS}
+        return {
+            'daily_active': self.get_unique_users(1),
+            'weekly_active': self.get_unique_users(7),
+            'today': today
+        }
+    
     # ============================================
     # SETTINGS MANAGEMENT
     # ============================================
@@ -225,5 +613,135 @@ class Database:
         else:
             self.memory_store["setting:validity_period"] = {'data': hours, 'expiry': float('inf')}
 
-# Initialize database
+    # ============================================
+    # BULK EXPORT / IMPORT
+    # ============================================
+    
+    def iter_records(self, batch_size: int = 1000) -> Iterator[Tuple[str, str, int]]:
+        """
+        Stream every exportable record as (key, value, ttl_ms)
+        ttl_ms is -1 for keys without expiry; index entries are
+        streamed as ("index:<name>:<user_id>", score, -1)
+        """
+        if self.db:
+            for prefix in EXPORT_PREFIXES:
+                batch = []
+                for key in self.db.scan_iter(match=f"{prefix}:*", count=batch_size):
+                    batch.append(key)
+                    if len(batch) >= batch_size:
+                        yield from self._fetch_records(batch)
+                        batch = []
+                if batch:
+                    yield from self._fetch_records(batch)
+            for index in INDEXES:
+                for member, score in self.db.zscan_iter(index, count=batch_size):
+                    yield f"{index}:{member}", repr(score), -1
+        else:
+            now = time.time()
+            for key, stored in list(self.memory_store.items()):
+                if key.split(':', 1)[0] not in EXPORT_PREFIXES or stored['expiry'] <= now:
+                    continue
+                data = stored['data']
+                value = data if isinstance(data, str) else json.dumps(data)
+                ttl = -1 if stored['expiry'] == float('inf') else int((stored['expiry'] - now) * 1000)
+                if ttl != 0:
+                    yield key, value, ttl
+            for index in INDEXES:
+                stored = self.memory_store.get(index)
+                for user_id, score in (list(stored['data'].items()) if stored else ()):
+                    yield f"{index}:{user_id}", repr(score), -1
+    
+    def _fetch_records(self, keys: List[str]) -> Iterator[Tuple[str, str, int]]:
+        """Fetch values and TTLs for a batch of keys in one round-trip"""
+        pipe = self.db.pipeline(transaction=False)
+        for key in keys:
+            pipe.get(key)
+            pipe.pttl(key)
+        results = pipe.execute()
+        for key, value, ttl in zip(keys, results[::2], results[1::2]):
+            # Skip keys that expired or were deleted since the scan
+            if value is not None and ttl not in (0, -2):
+                yield key, value, ttl
+    
+    def import_records(self, records: Iterable[Tuple[str, str, int]], batch_size: int = 1000) -> int:
+        """Load (key, value, ttl_ms) records, pipelining writes in batches"""
+        count = 0
+        if self.db:
+            pipe = self.db.pipeline(transaction=False)
+            for key, value, ttl in records:
+                if self._expired_record(ttl):
+                    continue
+                # Index entries are merged into their sorted set, not stored as keys
+                if not key.startswith('index:'):
+                    if ttl > 0:
+                        pipe.set(key, value, px=ttl)
+                    else:
+                        pipe.set(key, value)
+                self._index_record(key, value, pipe)
+                count += 1
+                if count % batch_size == 0:
+                    pipe.execute()
+            pipe.execute()
+        else:
+            now = time.time()
+            for key, value, ttl in records:
+                if self._expired_record(ttl):
+                    continue
+                if not key.startswith('index:'):
+                    data = value if key.startswith('ban:') else json.loads(value)
+                    expiry = now + ttl / 1000 if ttl > 0 else float('inf')
+                    self.memory_store[key] = {'data': data, 'expiry': expiry}
+                self._index_record(key, value)
+                count += 1
+        return count
+    
+    @staticmethod
+    def _expired_record(ttl: int) -> bool:
+        """True for records with no time left (-1 means no expiry)"""
+        return ttl != -1 and ttl <= 0
+    
+    def export_to(self, path: str) -> int:
+        """Write all records to a JSON-lines dump (gzip-compressed if path ends in .gz)"""
+        opener = gzip.open if path.endswith('.gz') else open
+        count = 0
+        with opener(path, 'wt', encoding='utf-8') as fp:
+            for record in self.iter_records():
+                fp.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+                fp.write('\n')
+                count += 1
+        return count
+    
+    def import_from(self, path: str) -> int:
+        """Load a dump written by export_to()"""
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'rt', encoding='utf-8') as fp:
+            records = (json.loads(line) for line in fp if line.strip())
+            return self.import_records(records)
+
+# Initialize database (connection is deferred until bootstrap or first use)
 db = Database()
+
+if __name__ == '__main__':
+    import argparse
+    import sys
+    
+    parser = argparse.ArgumentParser(
+        description="Export or import the user store (set REDIS_HOST/REDIS_PORT to pick the backend)"
+    )
+    parser.add_argument('action', choices=['export', 'import', 'reindex'])
+    parser.add_argument('path', nargs='?', help="dump file; a .gz suffix enables compression")
+    args = parser.parse_args()
+    
+    if not db.connect():
+        print("❌ Redis is unreachable; refusing to run against the in-memory fallback")
+        sys.exit(1)
+    started = time.time()
+    if args.action == 'reindex':
+        count = db.rebuild_indexes()
+    elif not args.path:
+        parser.error(f"{args.action} requires a dump path")
+    elif args.action == 'export':
+        count = db.export_to(args.path)
+    else:
+        count = db.import_from(args.path)
+    print(f"✅ {args.action.capitalize()}ed {count} records in {time.time() - started:.1f}s")
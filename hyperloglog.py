@@ -0,0 +1,49 @@
+"""
+HyperLogLog unique counter for the in-memory storage fallback.
+
+Mirrors Redis PFADD/PFCOUNT: fixed memory (16 KiB at the default
+precision) and ~0.8% standard error regardless of how many items are added.
+"""
+import hashlib
+import math
+from typing import Iterable
+
+
+class HyperLogLog:
+    def __init__(self, precision: int = 14):
+        self.p = precision
+        self.m = 1 << precision
+        self.registers = bytearray(self.m)
+
+    def add(self, item) -> bool:
+        """Add an item; returns True if the estimate may have changed"""
+        digest = hashlib.sha1(str(item).encode()).digest()
+        x = int.from_bytes(digest[:8], 'big')
+        index = x >> (64 - self.p)
+        rest = x & ((1 << (64 - self.p)) - 1)
+        rank = (64 - self.p) - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+            return True
+        return False
+
+    def merge(self, other: 'HyperLogLog'):
+        for i, value in enumerate(other.registers):
+            if value > self.registers[i]:
+                self.registers[i] = value
+
+    def count(self) -> int:
+        alpha = 0.7213 / (1 + 1.079 / self.m)
+        estimate = alpha * self.m * self.m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * self.m and zeros:
+            # Small range: linear counting is more accurate
+            estimate = self.m * math.log(self.m / zeros)
+        return int(round(estimate))
+
+    @classmethod
+    def union(cls, counters: Iterable['HyperLogLog']) -> 'HyperLogLog':
+        merged = cls()
+        for counter in counters:
+            merged.merge(counter)
+        return merged
@@ -0,0 +1,488 @@
+"""
+End-to-end load generator for the bot handlers.
+
+Replays a synthetic stream of NewMessage / CallbackQuery events through the
+handlers registered in main.py, using local stand-ins for Telegram, Redis and
+the link shortener, and reports handler latency and event-loop lag.
+
+Usage:
+    python loadtest.py --users 5000 --rate 500 --duration 30
+    python loadtest.py --mix start=1,token=1,link=3 --tg-latency 0.05
+"""
+import argparse
+import asyncio
+import fnmatch
+import random
+import sys
+import time
+import traceback
+from collections import Counter
+from typing import Dict, List, Optional
+
+import telethon
+from telethon.tl.types import InputPeerUser
+
+from config import OUTBOUND_RATE
+from hyperloglog import HyperLogLog
+
+
+# ============================================
+# TELEGRAM STAND-INS
+# ============================================
+
+class FakeClient:
+    """Records handlers registered with @bot.on instead of connecting"""
+
+    def __init__(self, *args, **kwargs):
+        self.handlers = []
+        self.latency = 0.0
+
+    def start(self, *args, **kwargs):
+        return self
+
+    def on(self, event_builder):
+        def decorator(callback):
+            self.handlers.append((event_builder, callback))
+            return callback
+        return decorator
+
+    def add_event_handler(self, callback, event_builder=None):
+        self.handlers.append((event_builder, callback))
+
+    async def send_message(self, entity, message='', **kwargs):
+        await asyncio.sleep(self.latency)
+        return FakeMessage(self, message)
+
+    async def send_file(self, entity, file, **kwargs):
+        await asyncio.sleep(self.latency)
+        return FakeMessage(self, kwargs.get('caption', ''))
+
+
+class FakeSender:
+    def __init__(self, user_id: int):
+        self.id = user_id
+        self.username = f"user{user_id}"
+        self.first_name = f"User {user_id}"
+
+
+class FakeMessage:
+    _next_id = 0
+
+    def __init__(self, client: FakeClient, text: str = '', chat_id: int = 0):
+        FakeMessage._next_id += 1
+        self.id = FakeMessage._next_id
+        self.client = client
+        self.text = text
+        self.chat_id = chat_id
+
+    async def edit(self, text=None, **kwargs):
+        await asyncio.sleep(self.client.latency)
+        self.text = text
+        return self
+
+
+class FakeEvent:
+    """Minimal surface of NewMessage.Event / CallbackQuery.Event used by main.py"""
+
+    def __init__(self, client: FakeClient, user_id: int, text: str = '', data: bytes = b''):
+        self.client = client
+        self.sender_id = user_id
+        self.chat_id = user_id
+        self.data = data
+        self.message = FakeMessage(client, text, user_id)
+        self.text = text
+
+    async def get_sender(self):
+        return FakeSender(self.sender_id)
+
+    async def get_input_sender(self):
+        return InputPeerUser(self.sender_id, self.sender_id * 7919)
+
+    async def respond(self, message='', **kwargs):
+        await asyncio.sleep(self.client.latency)
+        return FakeMessage(self.client, message, self.chat_id)
+
+    async def reply(self, message='', **kwargs):
+        return await self.respond(message, **kwargs)
+
+    async def edit(self, message='', **kwargs):
+        await asyncio.sleep(self.client.latency)
+        return self.message
+
+    async def answer(self, message=None, **kwargs):
+        await asyncio.sleep(self.client.latency)
+
+
+# ============================================
+# REDIS / SHORTENER STAND-INS
+# ============================================
+
+class FakeRedis:
+    """In-process subset of the redis-py API used by Database"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.store = {}
+        self.expiry = {}
+
+    def _wait(self):
+        # redis-py is synchronous, so latency blocks the event loop like the real client
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _alive(self, key):
+        exp = self.expiry.get(key)
+        if exp is not None and exp <= time.time():
+            self.store.pop(key, None)
+            self.expiry.pop(key, None)
+        return key in self.store
+
+    def ping(self):
+        self._wait()
+        return True
+
+    def get(self, key):
+        self._wait()
+        return self.store.get(key) if self._alive(key) else None
+
+    def set(self, key, value, **kwargs):
+        self._wait()
+        self.store[key] = str(value)
+        self.expiry.pop(key, None)
+        return True
+
+    def setex(self, key, seconds, value):
+        self._wait()
+        self.store[key] = str(value)
+        self.expiry[key] = time.time() + seconds
+        return True
+
+    def delete(self, *keys):
+        self._wait()
+        removed = 0
+        for key in keys:
+            if self._alive(key):
+                removed += 1
+            self.store.pop(key, None)
+            self.expiry.pop(key, None)
+        return removed
+
+    def exists(self, *keys):
+        self._wait()
+        return sum(1 for key in keys if self._alive(key))
+
+    def keys(self, pattern='*'):
+        self._wait()
+        return [key for key in list(self.store) if self._alive(key) and fnmatch.fnmatchcase(key, pattern)]
+
+    def mget(self, keys):
+        self._wait()
+        return [self.store.get(key) if self._alive(key) else None for key in keys]
+
+    def scan_iter(self, match='*', count=None):
+        return iter(self.keys(match))
+
+    def pttl(self, key):
+        self._wait()
+        if not self._alive(key):
+            return -2
+        exp = self.expiry.get(key)
+        return -1 if exp is None else int((exp - time.time()) * 1000)
+
+    def zadd(self, name, mapping, gt=False, lt=False):
+        self._wait()
+        zset = self.store.setdefault(name, {})
+        added = 0
+        for member, score in mapping.items():
+            member = str(member)
+            current = zset.get(member)
+            if current is None:
+                added += 1
+            elif (gt and score <= current) or (lt and score >= current):
+                continue
+            zset[member] = score
+        return added
+
+    def zscan_iter(self, name, count=None):
+        return iter(list(self.store.get(name, {}).items()))
+
+    def zrangebyscore(self, name, min, max):
+        self._wait()
+        zset = self.store.get(name, {})
+        return [member for member, score in sorted(zset.items(), key=lambda item: item[1])
+                if float(min) <= score <= float(max)]
+
+    def zdiff(self, keys):
+        self._wait()
+        first, *rest = [self.store.get(key, {}) for key in keys]
+        return [member for member in first if not any(member in other for other in rest)]
+
+    def incr(self, key):
+        self._wait()
+        value = int(self.store.get(key, 0) if self._alive(key) else 0) + 1
+        self.store[key] = str(value)
+        return value
+
+    def expire(self, key, seconds):
+        self._wait()
+        if not self._alive(key):
+            return False
+        self.expiry[key] = time.time() + seconds
+        return True
+
+    def pfadd(self, key, *values):
+        self._wait()
+        if not self._alive(key):
+            self.store[key] = HyperLogLog()
+        return int(any([self.store[key].add(value) for value in values]))
+
+    def pfcount(self, *keys):
+        self._wait()
+        return HyperLogLog.union(self.store[key] for key in keys if self._alive(key)).count()
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+
+class FakePipeline:
+    """Queues commands and runs them with a single simulated round-trip"""
+
+    def __init__(self, redis: FakeRedis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.redis, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def __len__(self):
+        return len(self.commands)
+
+    def execute(self):
+        latency, self.redis.latency = self.redis.latency, 0.0
+        try:
+            results = [method(*args, **kwargs) for method, args, kwargs in self.commands]
+        finally:
+            self.redis.latency = latency
+        self.commands = []
+        self.redis._wait()
+        return results
+
+
+class FakeShortener:
+    """Synchronous like LinkShortener, with a configurable API round-trip"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def shorten(self, url: str) -> str:
+        if self.latency:
+            time.sleep(self.latency)
+        return f"https://short.example/{abs(hash(url)) % 10**8}"
+
+
+# ============================================
+# LOAD GENERATOR
+# ============================================
+
+# scenario -> (handler name in main.py, event factory)
+SCENARIOS = {
+    'start': ('start', lambda c, uid: FakeEvent(c, uid, text='/start')),
+    'token': ('generate_token_callback', lambda c, uid: FakeEvent(c, uid, data=b'generate_token')),
+    'verify': ('check_verification', lambda c, uid: FakeEvent(c, uid, data=b'check_verification')),
+    'link': ('handle_terabox_link', lambda c, uid: FakeEvent(
+        c, uid, text=f"https://www.terabox.com/s/1{uid:010d}")),
+}
+
+
+def load_bot(client_latency: float, redis_latency: float, shortener_latency: float, outbound_rate: float):
+    """Import main.py against the stand-ins and return (module, client)"""
+    telethon.TelegramClient = FakeClient
+    try:
+        import main
+    except SyntaxError as e:
+        # main.py and shortener.py must be complete for their handlers to be replayed
+        sys.exit(f"❌ Cannot load the bot handlers: {e.filename}:{e.lineno}: {e.msg}")
+    from database import db
+
+    db.db = FakeRedis(redis_latency)
+    main.shortener = FakeShortener(shortener_latency)
+    main.bot.latency = client_latency
+    main.outbox.rate = main.outbox.max_rate = main.outbox.tokens = outbound_rate
+    return main, main.bot
+
+
+def seed_users(db, users: int, verified_ratio: float):
+    """Give a share of users an active verification and token"""
+    now = time.time()
+    for user_id in range(1, users + 1):
+        if random.random() < verified_ratio:
+            db.save_verification(user_id)
+            db.save_token(user_id, {
+                'user_id': user_id,
+                'generated_at': now,
+                'expires_at': now + 3600
+            })
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+async def monitor_loop_lag(samples: List[float], interval: float, stop: asyncio.Event):
+    """Measure how late the loop wakes a sleeping task"""
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+
+
+async def run_load(
+    client: FakeClient,
+    users: int,
+    rate: float,
+    duration: float,
+    mix: Dict[str, float],
+    lag_interval: float = 0.01
+) -> Dict:
+    handlers = {callback.__name__: callback for _, callback in client.handlers}
+    scenarios = [name for name in mix if mix[name] > 0]
+    weights = [mix[name] for name in scenarios]
+
+    latencies = {name: [] for name in scenarios}
+    errors = {name: 0 for name in scenarios}
+    error_types = {name: Counter() for name in scenarios}
+    first_tracebacks = {}
+    lag_samples = []
+
+    async def dispatch(name: str, user_id: int):
+        handler_name, make_event = SCENARIOS[name]
+        event = make_event(client, user_id)
+        started = time.perf_counter()
+        try:
+            await handlers[handler_name](event)
+        except Exception as e:
+            errors[name] += 1
+            error_types[name][type(e).__name__] += 1
+            if name not in first_tracebacks:
+                first_tracebacks[name] = traceback.format_exc()
+        latencies[name].append(time.perf_counter() - started)
+
+    loop = asyncio.get_running_loop()
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_loop_lag(lag_samples, lag_interval, stop))
+
+    # Open-loop arrivals: events are injected on schedule regardless of
+    # how fast handlers complete, like real users would.
+    tasks = []
+    total = int(rate * duration)
+    begin = loop.time()
+    for index in range(total):
+        delay = begin + index / rate - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        name = random.choices(scenarios, weights)[0]
+        tasks.append(asyncio.create_task(dispatch(name, random.randint(1, users))))
+
+    await asyncio.gather(*tasks)
+    elapsed = loop.time() - begin
+    stop.set()
+    await lag_task
+
+    return {
+        'events': total,
+        'elapsed': elapsed,
+        'latencies': latencies,
+        'errors': errors,
+        'error_types': error_types,
+        'tracebacks': first_tracebacks,
+        'loop_lag': lag_samples
+    }
+
+
+def format_report(result: Dict) -> str:
+    lines = [
+        f"📊 Events: {result['events']} in {result['elapsed']:.2f}s "
+        f"({result['events'] / max(result['elapsed'], 1e-9):.1f}/s)",
+        "",
+        f"{'scenario':<10} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+    ]
+    all_latencies = []
+    for name, values in result['latencies'].items():
+        all_latencies.extend(values)
+        lines.append(
+            f"{name:<10} {len(values):>7} {result['errors'][name]:>7} "
+            f"{percentile(values, 50) * 1000:>9.2f} "
+            f"{percentile(values, 95) * 1000:>9.2f} "
+            f"{percentile(values, 99) * 1000:>9.2f}"
+        )
+    lines.append(
+        f"{'all':<10} {len(all_latencies):>7} {sum(result['errors'].values()):>7} "
+        f"{percentile(all_latencies, 50) * 1000:>9.2f} "
+        f"{percentile(all_latencies, 95) * 1000:>9.2f} "
+        f"{percentile(all_latencies, 99) * 1000:>9.2f}"
+    )
+    lag = result['loop_lag']
+    lines += [
+        "",
+        f"⏱ Event-loop lag: p50 {percentile(lag, 50) * 1000:.2f} ms, "
+        f"p95 {percentile(lag, 95) * 1000:.2f} ms, "
+        f"p99 {percentile(lag, 99) * 1000:.2f} ms, "
+        f"max {max(lag, default=0.0) * 1000:.2f} ms"
+    ]
+    for name, trace in result['tracebacks'].items():
+        counts = ", ".join(f"{exc} x{count}" for exc, count in result['error_types'][name].most_common())
+        lines += ["", f"❌ {name} errors: {counts}", "First traceback:", trace.rstrip()]
+    return "\n".join(lines)
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(
+                f"unknown scenario '{name}' (choose from {', '.join(SCENARIOS)})"
+            )
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Replay synthetic updates through the bot handlers")
+    parser.add_argument('--users', type=int, default=1000, help="distinct simulated users")
+    parser.add_argument('--rate', type=float, default=200, help="events per second")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of traffic")
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('start=3,token=2,verify=1,link=4'),
+                        help="scenario weights, e.g. start=3,token=2,verify=1,link=4")
+    parser.add_argument('--verified-ratio', type=float, default=0.5,
+                        help="share of users seeded with an active token")
+    parser.add_argument('--tg-latency', type=float, default=0.05, help="Telegram API round-trip (s)")
+    parser.add_argument('--redis-latency', type=float, default=0.0005, help="Redis round-trip (s)")
+    parser.add_argument('--shortener-latency', type=float, default=0.2, help="shortener API round-trip (s)")
+    parser.add_argument('--outbound-rate', type=float, default=OUTBOUND_RATE,
+                        help="outbound scheduler messages per second")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    random.seed(args.seed)
+    bot_module, client = load_bot(args.tg_latency, args.redis_latency, args.shortener_latency,
+                                  args.outbound_rate)
+    seed_users(bot_module.db, args.users, args.verified_ratio)
+
+    result = asyncio.run(run_load(client, args.users, args.rate, args.duration, args.mix))
+    print(format_report(result))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
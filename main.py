@@ -11,6 +11,8 @@ from config import *
 from database import db
 from shortener import LinkShortener
 from broadcast import BroadcastManager
+from peers import PeerCacheSession, remember_peer
+from outbound import OutboundScheduler, RESULT
 
 # Configure logging
 logging.basicConfig(
@@ -19,12 +21,16 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Initialize bot
-bot = TelegramClient('terabox_bot', API_ID, API_HASH).start(bot_token=BOT_TOKEN)
+# Initialize bot (connected and logged in by bootstrap.py, not at import)
+# Telethon still sleeps through short FloodWaits itself (flood_sleep_threshold),
+# so calls outside the outbound scheduler - callback answers, login, admin
+# replies - wait them out; the scheduler adapts to the longer ones it sees.
+bot = TelegramClient(PeerCacheSession('terabox_bot'), API_ID, API_HASH)
 
 # Initialize managers
 shortener = LinkShortener()
-broadcast_manager = BroadcastManager(bot)
+outbox = OutboundScheduler()
+broadcast_manager = BroadcastManager(bot, outbox)
 
 # Broadcast state storage
 broadcast_states = {}
@@ -55,9 +61,11 @@ async def start(event):
     
     # Check if banned
     if db.is_banned(user_id):
-        await event.respond("🚫 **You are banned from using this bot.**")
+        await outbox.respond(event, "🚫 **You are banned from using this bot.**")
         return
     
+    await remember_peer(event)
+    
     # Add user to database
     user_data = {
         'user_id': user_id,
@@ -66,6 +74,7 @@ async def start(event):
         'last_active': time.time()
     }
     db.add_user(user_id, user_data)
+    db.record_event('start', user_id)
     
     # Check token status
     is_verified = db.is_verified(user_id)
@@ -89,17 +98,21 @@ async def start(event):
              Button.inline("❓ Help", b"help")]
         ]
     
-    await event.respond(message, buttons=buttons)
+    await outbox.respond(event, message, buttons=buttons)
 
 @bot.on(events.CallbackQuery(pattern=b'generate_token'))
 async def generate_token_callback(event):
     user_id = event.sender_id
+    db.touch_user(user_id)
+    await remember_peer(event)
     
     # Check if already verified
     if db.is_verified(user_id) and db.is_token_valid(user_id):
         await event.answer("✅ Your token is already active!", alert=True)
         return
     
+    db.record_event('token', user_id)
+    
     # Generate verification link
     verify_url = f"{VERIFICATION_URL}?id={user_id}"
     short_url = shortener.shorten(verify_url)
@@ -115,11 +128,13 @@ async def generate_token_callback(event):
         [Button.inline("🔙 Back", b"back_to_start")]
     ]
     
-    await event.edit(message, buttons=buttons)
+    await outbox.edit(event, message, buttons=buttons)
 
 @bot.on(events.CallbackQuery(pattern=b'check_verification'))
 async def check_verification(event):
     user_id = event.sender_id
+    db.touch_user(user_id)
+    await remember_peer(event)
     
     # In real implementation, check if user completed shortlink
     # For now, we'll mark as verified (you'll need to implement actual verification)
@@ -132,6 +147,7 @@ async def check_verification(event):
             'expires_at': time.time() + (TOKEN_DURATION_HOURS * 3600)
         }
         db.save_token(user_id, token_data)
+        db.record_event('verification', user_id)
         
         next_verify = datetime.now() + timedelta(days=TOKEN_VALIDITY_DAYS)
         
@@ -145,7 +161,7 @@ async def check_verification(event):
             [Button.inline("📊 My Stats", b"my_stats")]
         ]
         
-        await event.edit(message, buttons=buttons)
+        await outbox.edit(event, message, buttons=buttons)
     else:
         await event.answer(
             "❌ Verification not completed! Please complete the verification first.",
@@ -160,9 +176,13 @@ async def handle_terabox_link(event):
     if db.is_banned(user_id):
         return
     
+    db.touch_user(user_id)
+    await remember_peer(event)
+    
     # Check token validity
     if not db.is_token_valid(user_id):
-        await event.respond(
+        await outbox.respond(
+            event,
             "⚠️ **Token Expired or Invalid!**\n\n"
             "Please generate a new token to use the bot.",
             buttons=[[Button.inline("🔐 Generate Token", b"generate_token")]]
@@ -173,24 +193,56 @@ async def handle_terabox_link(event):
     if user_id in user_last_request:
         time_diff = time.time() - user_last_request[user_id]
         if time_diff < 60:
-            await event.respond(f"⏳ Wait {int(60 - time_diff)} seconds")
+            await outbox.respond(event, f"⏳ Wait {int(60 - time_diff)} seconds")
             return
     
     user_last_request[user_id] = time.time()
+    db.record_event('link', user_id)
     
     link = event.message.text
-    msg = await event.respond(
+    msg = await outbox.respond(
+        event,
         f"🔍 **Processing Terabox link...**\n\n"
         f"Link: `{link[:50]}...`"
     )
     
     # Your terabox processing logic here
-    await msg.edit(
+    await outbox.edit(
+        msg,
         "✅ **Video Found!**\n\n"
         "📹 Video processing will be implemented here\n"
-        "🎬 This is the token verification system demo"
+        "🎬 This is the token verification system demo",
+        lane=RESULT
     )
 
+# ============================================
+# ADMIN COMMANDS - USAGE ANALYTICS
+# ============================================
+
+@bot.on(events.NewMessage(pattern='/usage'))
+async def usage_command(event):
+    if not is_admin(event.sender_id):
+        return
+    
+    usage = db.get_usage_stats()
+    today = usage['today']
+    
+    message = (
+        f"📈 **Usage Analytics**\n\n"
+        f"👥 Daily active users: {usage['daily_active']}\n"
+        f"📅 Weekly active users: {usage['weekly_active']}\n\n"
+        f"**Today (UTC):**\n"
+        f"• /start: {today['start']}\n"
+        f"• Tokens generated: {today['token']}\n"
+        f"• Verifications: {today['verification']}\n"
+        f"• Links processed: {today['link']}\n\n"
+        f"**Links per hour (last 12h):**\n"
+    )
+    for hour, count in db.get_hourly_counts('link', 12):
+        message += f"`{hour[8:]}:00` {count}\n"
+    
+    await outbox.respond(event, message)
+
 # ============================================
 # ADMIN COMMANDS - BROADCAST SYSTEM
 # ============================================
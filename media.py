@@ -0,0 +1,395 @@
+"""
+Video metadata and thumbnail extraction for remote files.
+
+Only the byte ranges that matter are fetched: the MP4 box headers and the
+`moov` atom, or the MKV Info/Tracks elements. Thumbnails are cut from a
+single keyframe by ffmpeg, which seeks over HTTP with range requests.
+"""
+import asyncio
+import hashlib
+import logging
+import os
+import shutil
+import struct
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+
+from config import *
+from database import db
+
+logger = logging.getLogger(__name__)
+
+HEAD_BYTES = 256 * 1024          # First read; holds MKV headers and most faststart MP4 moov atoms
+MAX_MOOV_BYTES = 16 * 1024 * 1024
+THUMB_SIZE = 320                 # Telegram thumbnail limit (px)
+
+
+class MediaProbeError(Exception):
+    pass
+
+
+# ============================================
+# HTTP RANGE READS
+# ============================================
+
+async def fetch_range(session: aiohttp.ClientSession, url: str, start: int, end: int,
+                      headers: Dict = None) -> Tuple[bytes, Optional[int]]:
+    """
+    Fetch bytes [start, end] of url
+    Returns (data, total file size or None)
+    """
+    request_headers = dict(headers or {})
+    request_headers['Range'] = f"bytes={start}-{end}"
+    async with session.get(url, headers=request_headers) as resp:
+        if resp.status == 206:
+            total = None
+            content_range = resp.headers.get('Content-Range', '')
+            if '/' in content_range and not content_range.endswith('/*'):
+                total = int(content_range.rsplit('/', 1)[1])
+            return await resp.read(), total
+        if resp.status == 200:
+            # Server ignored Range: read only what we asked for, then drop the connection
+            if start > 0:
+                raise MediaProbeError("server does not support range requests")
+            try:
+                data = await resp.content.readexactly(end + 1)
+            except asyncio.IncompleteReadError as e:
+                data = e.partial  # File is shorter than the requested range
+            return data, resp.content_length
+        raise MediaProbeError(f"HTTP {resp.status}")
+
+
+# ============================================
+# MP4 PARSING
+# ============================================
+
+def _iter_boxes(data: bytes, start: int = 0, end: int = None):
+    """Yield (type, payload_start, payload_end) for boxes fully inside data[start:end]"""
+    end = len(data) if end is None else end
+    pos = start
+    while pos + 8 <= end:
+        size, box_type = struct.unpack('>I4s', data[pos:pos + 8])
+        header = 8
+        if size == 1:
+            if pos + 16 > end:
+                return
+            size = struct.unpack('>Q', data[pos + 8:pos + 16])[0]
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            return
+        yield box_type.decode('latin-1'), pos + header, pos + size
+        pos += size
+
+
+def _find_box(data: bytes, path: List[str], start: int = 0, end: int = None):
+    for box_type, payload_start, payload_end in _iter_boxes(data, start, end):
+        if box_type == path[0]:
+            if len(path) == 1:
+                return payload_start, payload_end
+            found = _find_box(data, path[1:], payload_start, payload_end)
+            if found:
+                return found
+    return None
+
+
+def parse_moov(moov: bytes) -> Dict:
+    """Extract duration and video dimensions from a moov payload"""
+    meta = {'duration': 0, 'width': 0, 'height': 0}
+
+    mvhd = _find_box(moov, ['mvhd'])
+    if mvhd:
+        pos = mvhd[0]
+        if moov[pos] == 1:
+            timescale, duration = struct.unpack('>IQ', moov[pos + 20:pos + 32])
+        else:
+            timescale, duration = struct.unpack('>II', moov[pos + 12:pos + 20])
+        if timescale:
+            meta['duration'] = int(duration / timescale)
+
+    for box_type, trak_start, trak_end in _iter_boxes(moov):
+        if box_type != 'trak':
+            continue
+        hdlr = _find_box(moov, ['mdia', 'hdlr'], trak_start, trak_end)
+        if not hdlr or moov[hdlr[0] + 8:hdlr[0] + 12] != b'vide':
+            continue
+        tkhd = _find_box(moov, ['tkhd'], trak_start, trak_end)
+        if tkhd:
+            pos = tkhd[0]
+            # width/height are 16.16 fixed point after the matrix
+            offset = 88 if moov[pos] == 1 else 76
+            width, height = struct.unpack('>II', moov[pos + offset:pos + offset + 8])
+            meta['width'] = width >> 16
+            meta['height'] = height >> 16
+        break
+
+    return meta
+
+
+async def probe_mp4(session, url: str, head: bytes, total: Optional[int], headers: Dict) -> Dict:
+    """Walk top-level boxes, fetching only box headers and the moov atom"""
+    pos = 0
+    seen_mdat = False
+    while total is None or pos < total:
+        if pos + 16 <= len(head):
+            chunk = head[pos:pos + 16]
+        else:
+            chunk, _ = await fetch_range(session, url, pos, pos + 15, headers)
+        if len(chunk) < 8:
+            break
+        size, box_type = struct.unpack('>I4s', chunk[:8])
+        header = 8
+        if size == 1:
+            size = struct.unpack('>Q', chunk[8:16])[0]
+            header = 16
+        elif size == 0:
+            if total is None:
+                break
+            size = total - pos
+        if size < header:
+            break
+
+        if box_type == b'moov':
+            if size > MAX_MOOV_BYTES:
+                raise MediaProbeError(f"moov atom too large ({size} bytes)")
+            if pos + size <= len(head):
+                moov = head[pos + header:pos + size]
+            else:
+                moov, _ = await fetch_range(session, url, pos + header, pos + size - 1, headers)
+            meta = parse_moov(moov)
+            meta['supports_streaming'] = not seen_mdat
+            return meta
+        if box_type == b'mdat':
+            seen_mdat = True
+        pos += size
+
+    raise MediaProbeError("moov atom not found")
+
+
+# ============================================
+# MATROSKA PARSING
+# ============================================
+
+EBML_SEGMENT = 0x18538067
+EBML_INFO = 0x1549A966
+EBML_TIMECODE_SCALE = 0x2AD7B1
+EBML_DURATION = 0x4489
+EBML_TRACKS = 0x1654AE6B
+EBML_TRACK_ENTRY = 0xAE
+EBML_TRACK_TYPE = 0x83
+EBML_VIDEO = 0xE0
+EBML_PIXEL_WIDTH = 0xB0
+EBML_PIXEL_HEIGHT = 0xBA
+EBML_CLUSTER = 0x1F43B675
+
+
+def _read_vint(data: bytes, pos: int, keep_marker: bool) -> Tuple[int, int]:
+    first = data[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8 or pos + length > len(data):
+        raise MediaProbeError("invalid EBML variable-length integer")
+    value = first if keep_marker else first & (mask - 1)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        value = -1  # unknown size
+    return value, pos + length
+
+
+def _iter_elements(data: bytes, start: int, end: int):
+    pos = start
+    while pos < end:
+        element_id, pos = _read_vint(data, pos, keep_marker=True)
+        size, pos = _read_vint(data, pos, keep_marker=False)
+        element_end = end if size < 0 else min(pos + size, end)
+        yield element_id, pos, element_end
+        pos = element_end
+
+
+def _uint(data: bytes, start: int, end: int) -> int:
+    return int.from_bytes(data[start:end], 'big')
+
+
+def parse_mkv(data: bytes) -> Dict:
+    """Extract duration and video dimensions from the head of a Matroska file"""
+    meta = {'duration': 0, 'width': 0, 'height': 0, 'supports_streaming': True}
+    timecode_scale = 1000000
+    duration = None
+
+    try:
+        for element_id, seg_start, seg_end in _iter_elements(data, 0, len(data)):
+            if element_id != EBML_SEGMENT:
+                continue
+            for child_id, start, end in _iter_elements(data, seg_start, seg_end):
+                if child_id == EBML_INFO:
+                    for info_id, i_start, i_end in _iter_elements(data, start, end):
+                        if info_id == EBML_TIMECODE_SCALE:
+                            timecode_scale = _uint(data, i_start, i_end)
+                        elif info_id == EBML_DURATION:
+                            fmt = '>d' if i_end - i_start == 8 else '>f'
+                            duration = struct.unpack(fmt, data[i_start:i_end])[0]
+                elif child_id == EBML_TRACKS:
+                    for entry_id, e_start, e_end in _iter_elements(data, start, end):
+                        if entry_id != EBML_TRACK_ENTRY:
+                            continue
+                        fields = dict((fid, (f_start, f_end)) for fid, f_start, f_end
+                                      in _iter_elements(data, e_start, e_end))
+                        if EBML_TRACK_TYPE not in fields or _uint(data, *fields[EBML_TRACK_TYPE]) != 1:
+                            continue
+                        if EBML_VIDEO in fields:
+                            for video_id, v_start, v_end in _iter_elements(data, *fields[EBML_VIDEO]):
+                                if video_id == EBML_PIXEL_WIDTH:
+                                    meta['width'] = _uint(data, v_start, v_end)
+                                elif video_id == EBML_PIXEL_HEIGHT:
+                                    meta['height'] = _uint(data, v_start, v_end)
+                        break
+                elif child_id == EBML_CLUSTER:
+                    break
+            break
+    except (IndexError, struct.error, MediaProbeError):
+        pass  # Truncated head; keep whatever was parsed
+
+    if duration is not None:
+        meta['duration'] = int(duration * timecode_scale / 1e9)
+    return meta
+
+
+# ============================================
+# THUMBNAILS
+# ============================================
+
+async def extract_thumbnail(url: str, seek: float, dest: str, headers: Dict = None,
+                            timeout: float = PROBE_TIMEOUT) -> Optional[str]:
+    """Decode one keyframe near `seek` seconds with ffmpeg and save a JPEG thumbnail"""
+    ffmpeg = shutil.which('ffmpeg')
+    if not ffmpeg:
+        logger.debug("ffmpeg not found, skipping thumbnail")
+        return None
+
+    args = [ffmpeg, '-v', 'error', '-ss', f"{seek:.2f}", '-skip_frame', 'nokey']
+    if headers:
+        args += ['-headers', ''.join(f"{k}: {v}\r\n" for k, v in headers.items())]
+    args += ['-i', url, '-frames:v', '1', '-f', 'image2pipe', '-vcodec', 'mjpeg', '-']
+
+    proc = await asyncio.create_subprocess_exec(
+        *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+    )
+    try:
+        frame, _ = await asyncio.wait_for(proc.communicate(), timeout)
+    except asyncio.TimeoutError:
+        proc.kill()
+        await proc.wait()
+        return None
+    if proc.returncode != 0 or not frame:
+        return None
+
+    return await asyncio.to_thread(_save_thumbnail, frame, dest)
+
+
+def _save_thumbnail(frame: bytes, dest: str) -> str:
+    import io
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(frame)).convert('RGB')
+    image.thumbnail((THUMB_SIZE, THUMB_SIZE))
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    image.save(dest, 'JPEG', quality=80)
+    return dest
+
+
+# ============================================
+# PUBLIC API
+# ============================================
+
+class VideoProber:
+    def __init__(self):
+        self.in_flight = {}
+
+    @staticmethod
+    def file_key(url: str) -> str:
+        return hashlib.sha1(url.encode()).hexdigest()
+
+    async def probe(self, url: str, file_key: str = None, thumbnail: bool = True) -> Optional[Dict]:
+        """
+        Get duration, dimensions and a thumbnail for a remote video
+        Results are cached per file; concurrent probes of one file share the work
+        Returns metadata dict or None if the file could not be probed
+        """
+        file_key = file_key or self.file_key(url)
+        meta = db.get_media_meta(file_key)
+        if meta is None:
+            meta = await self._shared(('meta', file_key), lambda: self._probe(url, file_key))
+            if meta is None:
+                return None
+
+        # A cached entry may lack a thumbnail (not requested, or ffmpeg failed);
+        # only the thumbnail step is re-run for it.
+        if thumbnail and not (meta.get('thumb') and os.path.exists(meta['thumb'])):
+            meta = await self._shared(('thumb', file_key), lambda: self._thumbnail(url, file_key, meta))
+        return meta
+
+    async def _shared(self, key: tuple, factory):
+        """Run factory() once per key at a time; concurrent callers await the same task"""
+        task = self.in_flight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        return await asyncio.shield(task)
+
+    @staticmethod
+    def _headers() -> Dict:
+        return {'Cookie': TERABOX_COOKIE} if TERABOX_COOKIE else {}
+
+    async def _probe(self, url: str, file_key: str) -> Optional[Dict]:
+        headers = self._headers()
+        timeout = aiohttp.ClientTimeout(total=PROBE_TIMEOUT)
+        try:
+            async with aiohttp.ClientSession(timeout=timeout) as session:
+                head, total = await fetch_range(session, url, 0, HEAD_BYTES - 1, headers)
+                if head[:4] == b'\x1a\x45\xdf\xa3':
+                    meta = parse_mkv(head)
+                elif head[4:8] in (b'ftyp', b'moov', b'mdat', b'free', b'wide', b'skip'):
+                    meta = await probe_mp4(session, url, head, total, headers)
+                else:
+                    raise MediaProbeError("unsupported container")
+        except (aiohttp.ClientError, asyncio.TimeoutError, MediaProbeError) as e:
+            logger.warning(f"⚠️ Metadata probe failed for {file_key}: {e}")
+            return None
+
+        meta['size'] = total
+        meta['thumb'] = None
+        meta['thumb_attempted'] = False
+        db.save_media_meta(file_key, meta)
+        return meta
+
+    async def _thumbnail(self, url: str, file_key: str, meta: Dict) -> Dict:
+        dest = os.path.join(THUMBNAIL_FOLDER, f"{file_key}.jpg")
+        seek = min(meta['duration'] * 0.1, 10) if meta['duration'] else 0
+        meta = dict(meta)
+        meta['thumb'] = await extract_thumbnail(url, seek, dest, self._headers())
+        meta['thumb_attempted'] = True
+        db.save_media_meta(file_key, meta)
+        return meta
+
+
+def video_attributes(meta: Dict) -> list:
+    """Build Telegram video attributes so the file plays inline"""
+    from telethon.tl.types import DocumentAttributeVideo
+
+    return [DocumentAttributeVideo(
+        duration=meta.get('duration', 0),
+        w=meta.get('width', 0),
+        h=meta.get('height', 0),
+        supports_streaming=meta.get('supports_streaming', True)
+    )]
+
+
+# Global prober instance
+prober = VideoProber()
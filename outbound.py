@@ -0,0 +1,213 @@
+"""
+Outbound message scheduler.
+
+Handler replies, edits and broadcasts go through one scheduler so that these
+senders share Telegram's flood budget:
+
+* Priority lanes - interactive replies go first, then job results, and
+  broadcasts only use capacity left over after a reserve kept for the others.
+* Adaptive rate - a token bucket whose rate is halved on FloodWaitError
+  (and paused for the requested time), then recovers gradually on success.
+  Telethon sleeps through waits under the client's flood_sleep_threshold
+  inside the call, so only longer waits reach the scheduler.
+* Per-chat ordering - at most one send per chat is in flight, and sends to a
+  chat complete in submission order even across lanes.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+from telethon.errors import FloodWaitError
+
+from config import *
+
+logger = logging.getLogger(__name__)
+
+# Lanes, highest priority first
+INTERACTIVE = 0
+RESULT = 1
+BROADCAST = 2
+
+
+class _Job:
+    __slots__ = ('chat_id', 'send', 'lane', 'future', 'attempts', 'dispatched')
+
+    def __init__(self, chat_id: int, send: Callable[[], Awaitable], lane: int, future: asyncio.Future):
+        self.chat_id = chat_id
+        self.send = send
+        self.lane = lane
+        self.future = future
+        self.attempts = 0
+        self.dispatched = False
+
+
+class OutboundScheduler:
+    def __init__(
+        self,
+        rate: float = OUTBOUND_RATE,
+        min_rate: float = 1.0,
+        max_rate: float = OUTBOUND_RATE,
+        broadcast_reserve: float = 0.3,
+        max_retries: int = 3
+    ):
+        """
+        Args:
+            rate: Initial sends per second
+            min_rate / max_rate: Bounds for the adaptive rate
+            broadcast_reserve: Share of the burst budget broadcasts may not use
+            max_retries: FloodWait retries per send before the error is raised
+        """
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.broadcast_reserve = broadcast_reserve
+        self.max_retries = max_retries
+
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+        self.lanes = [deque(), deque(), deque()]
+        self.chats = {}      # chat_id -> deque of pending jobs, submission order
+        self.busy = set()    # chats with a send in flight
+        self.sending = set()  # in-flight send tasks
+        self.wakeup = None
+        self.worker = None
+
+    # ============================================
+    # PUBLIC API
+    # ============================================
+
+    async def submit(self, chat_id: int, send: Callable[[], Awaitable], lane: int = INTERACTIVE):
+        """
+        Queue a send and wait for its result
+        `send` is a zero-argument callable returning the API coroutine, so
+        FloodWait retries can call it again
+        """
+        loop = asyncio.get_running_loop()
+        if self.worker is None or self.worker.done():
+            self.wakeup = asyncio.Event()
+            self.worker = loop.create_task(self._run())
+
+        job = _Job(chat_id, send, lane, loop.create_future())
+        self.lanes[lane].append(job)
+        self.chats.setdefault(chat_id, deque()).append(job)
+        self.wakeup.set()
+        return await job.future
+
+    async def respond(self, event, *args, lane: int = INTERACTIVE, **kwargs):
+        """Scheduled event.respond()"""
+        return await self.submit(event.chat_id, lambda: event.respond(*args, **kwargs), lane)
+
+    async def edit(self, target, *args, lane: int = INTERACTIVE, **kwargs):
+        """Scheduled edit of an event's message or a Message"""
+        return await self.submit(target.chat_id, lambda: target.edit(*args, **kwargs), lane)
+
+    async def close(self):
+        if self.worker:
+            self.worker.cancel()
+            try:
+                await self.worker
+            except asyncio.CancelledError:
+                pass
+            self.worker = None
+
+    def pending(self) -> int:
+        return sum(len(jobs) for jobs in self.chats.values())
+
+    # ============================================
+    # DISPATCH
+    # ============================================
+
+    def _next_job(self):
+        """Highest-priority sendable job: (job to send, lane it is scheduled at)"""
+        for lane, jobs in enumerate(self.lanes):
+            while jobs and jobs[0].dispatched:
+                jobs.popleft()
+            for job in jobs:
+                if job.dispatched or job.chat_id in self.busy:
+                    continue
+                # An earlier job for the same chat must go first; it inherits this lane
+                return self.chats[job.chat_id][0], lane
+        return None, None
+
+    def _delay(self, lane: int) -> float:
+        """Seconds until a send in `lane` is allowed (0 = now)"""
+        now = time.monotonic()
+        capacity = self.max_rate  # one second of burst at full speed
+        self.tokens = min(capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if now < self.paused_until:
+            return self.paused_until - now
+        needed = 1.0 + (self.broadcast_reserve * capacity if lane == BROADCAST else 0.0)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    async def _run(self):
+        while True:
+            job, lane = self._next_job()
+            if job is None:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+                continue
+
+            delay = self._delay(lane)
+            if delay > 0:
+                # Re-evaluate early if a higher-priority send arrives
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            self.tokens -= 1
+            job.dispatched = True
+            self.busy.add(job.chat_id)
+            task = asyncio.create_task(self._send(job))
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+    async def _send(self, job: _Job):
+        try:
+            result = await job.send()
+        except FloodWaitError as e:
+            self._on_flood_wait(e.seconds)
+            job.attempts += 1
+            if job.attempts <= self.max_retries and not job.future.cancelled():
+                # Stay at the head of the chat queue and retry after the pause
+                job.dispatched = False
+                self.lanes[job.lane].appendleft(job)
+                self.busy.discard(job.chat_id)
+                self.wakeup.set()
+                return
+            self._finish(job)
+            if not job.future.done():
+                job.future.set_exception(e)
+        except Exception as e:
+            self._finish(job)
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.rate = min(self.max_rate, self.rate + 0.1)
+            self._finish(job)
+            if not job.future.done():
+                job.future.set_result(result)
+
+    def _finish(self, job: _Job):
+        queue = self.chats[job.chat_id]
+        queue.popleft()
+        if not queue:
+            del self.chats[job.chat_id]
+        self.busy.discard(job.chat_id)
+        self.wakeup.set()
+
+    def _on_flood_wait(self, seconds: int):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.rate = max(self.min_rate, self.rate / 2)
+        self.tokens = 0.0
+        logger.warning(f"⚠️ FloodWait {seconds}s: outbound rate lowered to {self.rate:.1f}/s")
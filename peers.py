@@ -0,0 +1,72 @@
+"""
+Shared peer cache.
+
+Telegram only accepts a user as a send target together with the access
+hash the bot saw for them. Telethon keeps those hashes in the local
+session file, which is lost on a new container or session reset and is
+not visible to other processes. The hashes are recorded in Database
+whenever a user interacts, and looked up from there before any send.
+"""
+import logging
+from typing import Dict, List, Union
+
+from telethon.sessions import SQLiteSession
+from telethon.tl.types import InputPeerUser, PeerUser
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+# Peers already written by this process: user_id -> access_hash
+_known_peers = {}
+
+
+async def remember_peer(event):
+    """Record the sender's access hash from an incoming update"""
+    user_id = event.sender_id
+    if not user_id or user_id < 0:
+        return
+    try:
+        peer = await event.get_input_sender()
+    except Exception as e:
+        logger.debug(f"Could not get input sender for {user_id}: {e}")
+        return
+    if isinstance(peer, InputPeerUser) and _known_peers.get(user_id) != peer.access_hash:
+        db.save_peer(user_id, peer.access_hash)
+        _known_peers[user_id] = peer.access_hash
+
+
+def input_peer(user_id: int) -> Union[InputPeerUser, int]:
+    """InputPeerUser for a cached user, or the bare ID for Telethon to resolve"""
+    access_hash = _known_peers.get(user_id)
+    if access_hash is None:
+        access_hash = db.get_peer(user_id)
+    return InputPeerUser(user_id, access_hash) if access_hash is not None else user_id
+
+
+def input_peers(user_ids: List[int]) -> Dict[int, Union[InputPeerUser, int]]:
+    """Bulk input_peer() for broadcasts"""
+    peers = db.get_peers(user_ids)
+    return {
+        uid: InputPeerUser(uid, peers[uid]) if uid in peers else uid
+        for uid in user_ids
+    }
+
+
+class PeerCacheSession(SQLiteSession):
+    """SQLite session that falls back to the shared peer cache for unknown users"""
+
+    def get_input_entity(self, key):
+        try:
+            return super().get_input_entity(key)
+        except ValueError:
+            if isinstance(key, PeerUser):
+                user_id = key.user_id
+            elif isinstance(key, int) and key > 0:
+                user_id = key
+            else:
+                raise
+            peer = input_peer(user_id)
+            if not isinstance(peer, InputPeerUser):
+                raise
+            return peer